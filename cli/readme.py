@@ -1,12 +1,16 @@
 # imports
 import os
 import json
-import glob
 import argparse
 import hashlib
 import random
+import re
 import string
 import yaml
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from pathlib import Path
 
 # define constants
 EXCLUDED_JOBS = ["java", "spark-job-component", "storage_pe", "user-assigned-identity"]
@@ -48,6 +52,29 @@ EXCLUDED_SCRIPTS = [
     "deploy-custom-container-multimodel-minimal",
     "run-pipeline-jobs",
 ]
+# hidden directories such as .git and .venv are always skipped
+EXCLUDED_DIRECTORIES = ["node_modules", "__pycache__", "venv"]
+# match any excluded substring in a single pass, never matching if none are excluded
+EXCLUDED_JOBS_PATTERN = re.compile("|".join(map(re.escape, EXCLUDED_JOBS)) or "(?!)")
+EXCLUDED_ENDPOINTS_PATTERN = re.compile(
+    "|".join(map(re.escape, EXCLUDED_ENDPOINTS)) or "(?!)"
+)
+EXCLUDED_DEPLOYMENTS_PATTERN = re.compile(
+    "|".join(map(re.escape, EXCLUDED_DEPLOYMENTS)) or "(?!)"
+)
+EXCLUDED_RESOURCES_PATTERN = re.compile(
+    "|".join(map(re.escape, EXCLUDED_RESOURCES)) or "(?!)"
+)
+EXCLUDED_ASSETS_PATTERN = re.compile(
+    "|".join(map(re.escape, EXCLUDED_ASSETS)) or "(?!)"
+)
+EXCLUDED_SCHEDULES_PATTERN = re.compile(
+    "|".join(map(re.escape, EXCLUDED_SCHEDULES)) or "(?!)"
+)
+EXCLUDED_SCRIPTS_PATTERN = re.compile(
+    "|".join(map(re.escape, EXCLUDED_SCRIPTS)) or "(?!)"
+)
+DESCRIPTION_PATTERN = re.compile(rb"description: (.*)")
 READONLY_HEADER = "# This code is autogenerated.\
 \n# Code is generated by running custom script: python3 readme.py\
 \n# Any manual changes to this file may cause incorrect behavior.\
@@ -59,123 +86,202 @@ GITHUB_WORKSPACE = "${{ github.workspace }}"
 GITHUB_CONCURRENCY_GROUP = (
     "${{ github.workflow }}-${{ github.event.pull_request.number || github.ref }}"
 )
+# where workflows are written, resolved from this file rather than the working directory
+WORKFLOW_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", ".github", "workflows")
+)
 # BRANCH = "sdk-preview"  # this should be deleted when this branch is merged to main
 hours_between_runs = 12
+# triggers and the login, bootstrap and setup steps shared by all workflows
+WORKFLOW_PRELUDE_TEMPLATE = (
+    READONLY_HEADER
+    + """
+name: {name}
+on:
+  workflow_dispatch:
+  schedule:
+    - cron: "{schedule_minute} {schedule_hour}/{hours_between_runs} * * *"
+  pull_request:
+    branches:
+      - main
+    paths:
+{paths}      - cli/setup.sh
+permissions:
+  id-token: write
+concurrency:
+  group: {concurrency_group}
+  cancel-in-progress: true
+jobs:
+  build:
+    runs-on: ubuntu-latest
+    steps:
+    - name: check out repo
+      uses: actions/checkout@v2
+    - name: azure login
+      uses: azure/login@v1
+      with:
+        client-id: ${{{{ secrets.OIDC_AZURE_CLIENT_ID }}}}
+        tenant-id: ${{{{ secrets.OIDC_AZURE_TENANT_ID }}}}
+        subscription-id: ${{{{ secrets.OIDC_AZURE_SUBSCRIPTION_ID }}}}
+    - name: bootstrap resources
+      run: |
+{bootstrap}      working-directory: {bootstrap_dir}
+      continue-on-error: false
+    - name: setup-cli
+      run: |
+          source "{workspace}/infra/bootstrapping/sdk_helpers.sh";
+          source "{workspace}/infra/bootstrapping/init_environment.sh";
+          bash setup.sh
+      working-directory: cli
+      continue-on-error: true
+"""
+)
 
 
-# define functions
-def main(args):
-    # get list of notebooks
-    notebooks = sorted(glob.glob("**/*.ipynb", recursive=True))
-
-    # make all notebooks consistent
-    modify_notebooks(notebooks)
-
-    # get list of jobs
-    jobs = sorted(glob.glob("jobs/**/*job*.yml", recursive=True))
-    jobs += sorted(glob.glob("jobs/basics/*.yml", recursive=False))
-    jobs += sorted(glob.glob("jobs/*/basics/**/*job*.yml", recursive=True))
-    jobs += sorted(glob.glob("jobs/pipelines/**/*pipeline*.yml", recursive=True))
-    jobs += sorted(glob.glob("jobs/spark/*.yml", recursive=False))
-    jobs += sorted(
-        glob.glob("jobs/automl-standalone-jobs/**/cli-automl-*.yml", recursive=True)
-    )
-    jobs += sorted(
-        glob.glob("jobs/pipelines-with-components/**/*pipeline*.yml", recursive=True)
-    )
-    jobs += sorted(
-        glob.glob("jobs/automl-standalone-jobs/**/*cli-automl*.yml", recursive=True)
-    )
-    jobs += sorted(glob.glob("responsible-ai/**/cli-*.yml", recursive=True))
-    jobs += sorted(glob.glob("jobs/parallel/**/*pipeline*.yml", recursive=True))
-    jobs = [
-        job.replace(".yml", "")
-        for job in jobs
-        if not any(excluded in job for excluded in EXCLUDED_JOBS)
-    ]
+def split_template(template):
+    # splits a format string into its literal runs and the field names between them
+    statics, keys = [""], []
+    for literal, key, _, _ in string.Formatter().parse(template):
+        statics[-1] += literal
+        if key is not None:
+            keys.append(key)
+            statics.append("")
+    return statics, keys
 
-    jobs_using_registry_components = sorted(
-        glob.glob(
-            "jobs/pipelines-with-components/basics/**/*pipeline*.yml", recursive=True
-        )
-    )
-    jobs_using_registry_components = [
-        job.replace(".yml", "")
-        for job in jobs_using_registry_components
-        if not any(excluded in job.replace(os.sep, "/") for excluded in EXCLUDED_JOBS)
-    ]
 
-    # get list of endpoints
-    endpoints = sorted(glob.glob("endpoints/**/*endpoint.yml", recursive=True))
-    endpoints = [
-        endpoint.replace(".yml", "")
-        for endpoint in endpoints
-        if not any(
-            excluded in endpoint.replace(os.sep, "/") for excluded in EXCLUDED_ENDPOINTS
-        )
-    ]
+# the prelude split once, so rendering interleaves the literal runs and values
+# instead of re-parsing the template per workflow
+WORKFLOW_PRELUDE_STATICS, WORKFLOW_PRELUDE_KEYS = split_template(
+    WORKFLOW_PRELUDE_TEMPLATE
+)
+# constant steps of spark job workflows
+SPARK_UPLOAD_DATA_STEP = """    - name: upload data
+      run: |
+          bash -x upload-data-to-blob.sh jobs/spark/
+      working-directory: cli
+      continue-on-error: true\n"""
+SPARK_SETUP_ATTACHED_STEP = """    - name: setup attached spark
+      working-directory: cli
+      continue-on-error: true"""
+# compute each identity's attached spark is set up with, in the order they're checked
+SPARK_ATTACHED_COMPUTES = [
+    ("user-identity", "attached-spark-user-identity.yml"),
+    ("managed-identity", "attached-spark-system-identity.yml"),
+    ("default-identity", "attached-spark.yml"),
+]
+# raw: path on disk, posix: "/"-separated path without extension,
+# hyphenated: posix with "-" separators, filename and project_dir: split from posix
+PathInfo = namedtuple(
+    "PathInfo", ["raw", "posix", "hyphenated", "filename", "project_dir"]
+)
 
-    # get list of resources
-    resources = sorted(glob.glob("resources/**/*.yml", recursive=True))
-    resources = [
-        resource.replace(".yml", "")
-        for resource in resources
-        if not any(
-            excluded in resource.replace(os.sep, "/") for excluded in EXCLUDED_RESOURCES
-        )
-    ]
 
-    # get list of assets
-    assets = sorted(glob.glob("assets/**/*.yml", recursive=True))
-    assets = [
-        asset.replace(".yml", "")
-        for asset in assets
-        if not any(
-            excluded in asset.replace(os.sep, "/") for excluded in EXCLUDED_ASSETS
-        )
-    ]
+# define functions
+def main(args):
+    # get list of files
+    paths = get_paths()
 
-    # get list of scripts
-    scripts = sorted(glob.glob("*.sh", recursive=False))
-    scripts = [
-        script.replace(".sh", "")
-        for script in scripts
-        if not any(
-            excluded in script.replace(os.sep, "/") for excluded in EXCLUDED_SCRIPTS
+    # get list of notebooks
+    notebooks = find_paths(paths, "**/*.ipynb")
+
+    # run independent stages concurrently, as they touch disjoint files
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        # make all notebooks consistent while the remaining paths are collected
+        notebooks_modified = executor.submit(modify_notebooks, notebooks)
+
+        # get list of jobs
+        jobs = find_paths(paths, "jobs/**/*job*.yml")
+        jobs += find_paths(paths, "jobs/basics/*.yml")
+        jobs += find_paths(paths, "jobs/*/basics/**/*job*.yml")
+        jobs += find_paths(paths, "jobs/pipelines/**/*pipeline*.yml")
+        jobs += find_paths(paths, "jobs/spark/*.yml")
+        jobs += find_paths(paths, "jobs/automl-standalone-jobs/**/cli-automl-*.yml")
+        jobs += find_paths(paths, "jobs/pipelines-with-components/**/*pipeline*.yml")
+        jobs += find_paths(paths, "jobs/automl-standalone-jobs/**/*cli-automl*.yml")
+        jobs += find_paths(paths, "responsible-ai/**/cli-*.yml")
+        jobs += find_paths(paths, "jobs/parallel/**/*pipeline*.yml")
+        jobs = [
+            job
+            for job in map(parse_path, jobs)
+            if not EXCLUDED_JOBS_PATTERN.search(job.posix)
+        ]
+
+        jobs_using_registry_components = find_paths(
+            paths, "jobs/pipelines-with-components/basics/**/*pipeline*.yml"
         )
-    ]
-
-    # get list of schedules
-    schedules = sorted(glob.glob("schedules/**/*schedule.yml", recursive=True))
-    schedules = [
-        schedule.replace(".yml", "")
-        for schedule in schedules
-        if not any(
-            excluded in schedule.replace(os.sep, "/") for excluded in EXCLUDED_SCHEDULES
+        jobs_using_registry_components = [
+            job
+            for job in map(parse_path, jobs_using_registry_components)
+            if not EXCLUDED_JOBS_PATTERN.search(job.posix)
+        ]
+
+        # get list of endpoints
+        endpoints = find_paths(paths, "endpoints/**/*endpoint.yml")
+        endpoints = [
+            endpoint
+            for endpoint in map(parse_path, endpoints)
+            if not EXCLUDED_ENDPOINTS_PATTERN.search(endpoint.posix)
+        ]
+
+        # get deployments of each endpoint directory
+        deployments = get_deployments(paths)
+
+        # get list of resources
+        resources = find_paths(paths, "resources/**/*.yml")
+        resources = [
+            resource
+            for resource in map(parse_path, resources)
+            if not EXCLUDED_RESOURCES_PATTERN.search(resource.posix)
+        ]
+
+        # get list of assets
+        assets = find_paths(paths, "assets/**/*.yml")
+        assets = [
+            asset
+            for asset in map(parse_path, assets)
+            if not EXCLUDED_ASSETS_PATTERN.search(asset.posix)
+        ]
+
+        # get list of scripts
+        scripts = find_paths(paths, "*.sh")
+        scripts = [
+            script
+            for script in map(parse_path, scripts)
+            if not EXCLUDED_SCRIPTS_PATTERN.search(script.posix)
+        ]
+
+        # get list of schedules
+        schedules = find_paths(paths, "schedules/**/*schedule.yml")
+        schedules = [
+            schedule
+            for schedule in map(parse_path, schedules)
+            if not EXCLUDED_SCHEDULES_PATTERN.search(schedule.posix)
+        ]
+
+        # write workflows while README.md is generated
+        workflows_written = executor.submit(
+            write_workflows,
+            jobs,
+            jobs_using_registry_components,
+            endpoints,
+            deployments,
+            resources,
+            assets,
+            scripts,
+            schedules,
         )
-    ]
 
-    # write workflows
-    write_workflows(
-        jobs,
-        jobs_using_registry_components,
-        endpoints,
-        resources,
-        assets,
-        scripts,
-        schedules,
-    )
+        # read existing README.md
+        readme_before = Path("README.md").read_text(encoding="utf-8")
 
-    # read existing README.md
-    with open("README.md", "r") as f:
-        readme_before = f.read()
-
-    # write README.md
-    write_readme(jobs, endpoints, resources, assets, scripts, schedules)
+        # write README.md
+        readme_after = write_readme(
+            jobs, endpoints, resources, assets, scripts, schedules
+        )
 
-    # read modified README.md
-    with open("README.md", "r") as f:
-        readme_after = f.read()
+        # wait for the background stages, raising any error they hit
+        notebooks_modified.result()
+        workflows_written.result()
 
     # check if readme matches
     if args.check_readme:
@@ -192,163 +298,132 @@ def modify_notebooks(notebooks):
         "name": "python38-azureml",
     }
 
-    # for each notebooks
-    for notebook in notebooks:
-        # read in notebook
-        with open(notebook, "r") as f:
-            data = json.load(f)
+    # modify notebooks in parallel, as the work is dominated by file I/O
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+        list(executor.map(partial(modify_notebook, kernelspec=kernelspec), notebooks))
 
-        # update metadata
-        data["metadata"]["kernelspec"] = kernelspec
 
-        # write notebook
-        with open(notebook, "w") as f:
-            json.dump(data, f, indent=1)
+def modify_notebook(notebook, kernelspec):
+    # read in notebook
+    before = Path(notebook).read_bytes()
+    data = json.loads(before)
 
+    # update metadata
+    data["metadata"]["kernelspec"] = kernelspec
+    after = json.dumps(data, indent=1).encode()
 
-def write_readme(jobs, endpoints, resources, assets, scripts, schedules):
-    # read in prefix.md and suffix.md
-    with open("prefix.md", "r") as f:
-        prefix = f.read()
-    with open("suffix.md", "r") as f:
-        suffix = f.read()
-
-    # define markdown tables
-    jobs_table = "\n**Jobs** ([jobs](jobs))\n\npath|status|description\n-|-|-\n"
-    endpoints_table = (
-        "\n**Endpoints** ([endpoints](endpoints))\n\npath|status|description\n-|-|-\n"
-    )
-    resources_table = (
-        "\n**Resources** ([resources](resources))\n\npath|status|description\n-|-|-\n"
-    )
-    assets_table = "\n**Assets** ([assets](assets))\n\npath|status|description\n-|-|-\n"
-    scripts_table = "\n**Scripts**\n\npath|status|\n-|-\n"
-    schedules_table = "\n**Schedules**\n\npath|status|\n-|-\n"
-
-    # process jobs
-    for job in jobs:
-        # build entries for tutorial table
-        posix_job = job.replace(os.sep, "/")
-        job_name = posix_job.replace("/", "-")
-        status = f"[![{posix_job}](https://github.com/Azure/azureml-examples/workflows/cli-{job_name}/badge.svg?branch={BRANCH})](https://github.com/Azure/azureml-examples/actions/workflows/cli-{job_name}.yml)"
-        description = "*no description*"
-        try:
-            with open(f"{job}.yml", "r") as f:
-                for line in f.readlines():
-                    if "description: " in str(line):
-                        description = line.split(": ")[-1].strip()
-                        break
-        except:
-            pass
+    # write notebook only if it changed
+    if after != before:
+        write_file(notebook, after)
 
-        # add row to tutorial table
-        row = f"[{posix_job}.yml]({posix_job}.yml)|{status}|{description}\n"
-        jobs_table += row
 
-    # process endpoints
-    for endpoint in endpoints:
-        # build entries for tutorial table
-        posix_endpoint = endpoint.replace(os.sep, "/")
-        endpoint_name = posix_endpoint.replace("/", "-")
-        status = f"[![{posix_endpoint}](https://github.com/Azure/azureml-examples/workflows/cli-{endpoint_name}/badge.svg?branch={BRANCH})](https://github.com/Azure/azureml-examples/actions/workflows/cli-{endpoint_name}.yml)"
-        description = "*no description*"
-        try:
-            with open(f"{endpoint}.yml", "r") as f:
-                for line in f.readlines():
-                    if "description: " in str(line):
-                        description = line.split(": ")[-1].strip()
-                        break
-        except:
-            pass
+def write_readme(jobs, endpoints, resources, assets, scripts, schedules):
+    # read in prefix.md and suffix.md
+    prefix = Path("prefix.md").read_text(encoding="utf-8")
+    suffix = Path("suffix.md").read_text(encoding="utf-8")
 
-        # add row to tutorial table
-        row = f"[{posix_endpoint}.yml]({posix_endpoint}.yml)|{status}|{description}\n"
-        endpoints_table += row
+    # read descriptions from .yml files
+    descriptions = get_descriptions(
+        [path.raw for path in jobs + endpoints + resources + assets]
+    )
 
-    # process resources
-    for resource in resources:
-        # build entries for tutorial table
-        posix_resource = resource.replace(os.sep, "/")
-        resource_name = posix_resource.replace("/", "-")
-        status = f"[![{posix_resource}](https://github.com/Azure/azureml-examples/workflows/cli-{resource_name}/badge.svg?branch={BRANCH})](https://github.com/Azure/azureml-examples/actions/workflows/cli-{resource_name}.yml)"
-        description = "*no description*"
-        try:
-            with open(f"{resource}.yml", "r") as f:
-                for line in f.readlines():
-                    if "description: " in str(line):
-                        description = line.split(": ")[-1].strip()
-                        break
-        except:
-            pass
+    # define markdown tables in the order they appear in README.md
+    tables = [
+        (
+            "\n**Scripts**\n\npath|status|\n-|-\n",
+            scripts,
+            ".sh",
+            "cli-scripts-",
+            True,
+            None,
+        ),
+        (
+            "\n**Jobs** ([jobs](jobs))\n\npath|status|description\n-|-|-\n",
+            jobs,
+            ".yml",
+            "cli-",
+            True,
+            descriptions,
+        ),
+        (
+            "\n**Endpoints** ([endpoints](endpoints))\n\npath|status|description\n-|-|-\n",
+            endpoints,
+            ".yml",
+            "cli-",
+            True,
+            descriptions,
+        ),
+        (
+            "\n**Resources** ([resources](resources))\n\npath|status|description\n-|-|-\n",
+            resources,
+            ".yml",
+            "cli-",
+            True,
+            descriptions,
+        ),
+        (
+            "\n**Assets** ([assets](assets))\n\npath|status|description\n-|-|-\n",
+            assets,
+            ".yml",
+            "cli-",
+            True,
+            descriptions,
+        ),
+        (
+            "\n**Schedules**\n\npath|status|\n-|-\n",
+            schedules,
+            ".yml",
+            "cli-schedules-",
+            False,
+            None,
+        ),
+    ]
 
-        # add row to tutorial table
-        row = f"[{posix_resource}.yml]({posix_resource}.yml)|{status}|{description}\n"
-        resources_table += row
+    # build markdown tables
+    parts = [prefix]
+    for table in tables:
+        parts += get_table(*table)
+    parts.append(suffix)
 
-    # process assets
-    for asset in assets:
-        # build entries for tutorial table
-        posix_asset = asset.replace(os.sep, "/")
-        asset_name = posix_asset.replace("/", "-")
-        status = f"[![{posix_asset}](https://github.com/Azure/azureml-examples/workflows/cli-{asset_name}/badge.svg?branch={BRANCH})](https://github.com/Azure/azureml-examples/actions/workflows/cli-{asset_name}.yml)"
-        description = "*no description*"
-        try:
-            with open(f"{asset}.yml", "r") as f:
-                for line in f.readlines():
-                    if "description: " in str(line):
-                        description = line.split(": ")[-1].strip()
-                        break
-        except:
-            pass
+    # write README.md
+    print("writing README.md...")
+    readme = "".join(parts)
+    write_file("README.md", readme.encode())
+    print("Finished writing README.md...")
 
-        # add row to tutorial table
-        row = f"[{posix_asset}.yml]({posix_asset}.yml)|{status}|{description}\n"
-        assets_table += row
-
-    # process scripts
-    for script in scripts:
-        # build entries for tutorial table
-        posix_script = script.replace(os.sep, "/")
-        status = f"[![{posix_script}](https://github.com/Azure/azureml-examples/workflows/cli-scripts-{script}/badge.svg?branch={BRANCH})](https://github.com/Azure/azureml-examples/actions/workflows/cli-scripts-{script}.yml)"
-        link = f"https://scripts.microsoft.com/azure/machine-learning/{script}"
-
-        # add row to tutorial table
-        row = f"[{posix_script}.sh]({posix_script}.sh)|{status}\n"
-        scripts_table += row
-
-    # process schedules
-    for schedule in schedules:
-        # build entries for tutorial table
-        posix_schedule = schedule.replace(os.sep, "/")
-        status = f"[![{posix_schedule}](https://github.com/Azure/azureml-examples/workflows/cli-schedules-{posix_schedule}/badge.svg?branch={BRANCH})](https://github.com/Azure/azureml-examples/actions/workflows/cli-schedules-{posix_schedule}.yml)"
-        link = (
-            f"https://schedules.microsoft.com/azure/machine-learning/{posix_schedule}"
-        )
+    return readme
 
-        # add row to tutorial table
-        row = f"[{posix_schedule}.yml]({posix_schedule}.yml)|{status}\n"
-        schedules_table += row
 
-    # write README.md
-    print("writing README.md...")
-    with open("README.md", "w") as f:
-        f.write(
-            prefix
-            + scripts_table
-            + jobs_table
-            + endpoints_table
-            + resources_table
-            + assets_table
-            + schedules_table
-            + suffix
+def get_table(header, paths, extension, workflow_prefix, hyphenate, descriptions):
+    # builds the rows of a markdown table linking each path to its workflow badge,
+    # one column at a time
+    posix_paths = [path.posix for path in paths]
+    workflow_names = [
+        workflow_prefix + (path.hyphenated if hyphenate else path.posix)
+        for path in paths
+    ]
+    statuses = [
+        f"[![{posix_path}](https://github.com/Azure/azureml-examples/workflows/{workflow_name}/badge.svg?branch={BRANCH})](https://github.com/Azure/azureml-examples/actions/workflows/{workflow_name}.yml)"
+        for posix_path, workflow_name in zip(posix_paths, workflow_names)
+    ]
+    if descriptions is None:
+        description_cells = [""] * len(paths)
+    else:
+        description_cells = [f"|{descriptions[path.raw]}" for path in paths]
+
+    return [header] + [
+        f"[{posix_path}{extension}]({posix_path}{extension})|{status}{description_cell}\n"
+        for posix_path, status, description_cell in zip(
+            posix_paths, statuses, description_cells
         )
-    print("Finished writing README.md...")
+    ]
 
 
 def write_workflows(
     jobs,
     jobs_using_registry_components,
     endpoints,
+    deployments,
     resources,
     assets,
     scripts,
@@ -356,40 +431,76 @@ def write_workflows(
 ):
     print("writing .github/workflows...")
 
-    # process jobs
-    for job in jobs:
-        # write workflow file
-        write_job_workflow(job)
-
-    # process jobs_using_registry_components
-    for job in jobs_using_registry_components:
-        # write workflow file
-        write_job_using_registry_components_workflow(job)
-
-    # process endpoints
-    for endpoint in endpoints:
-        # write workflow file
-        write_endpoint_workflow(endpoint)
+    # build every workflow in memory first
+    endpoint_workflow = partial(get_endpoint_workflow, deployments=deployments)
+    builders = (
+        [(get_job_workflow, job) for job in jobs]
+        + [
+            (get_job_using_registry_components_workflow, job)
+            for job in jobs_using_registry_components
+        ]
+        + [(endpoint_workflow, endpoint) for endpoint in endpoints]
+        + [(get_asset_workflow, resource) for resource in resources]
+        + [(get_asset_workflow, asset) for asset in assets]
+        + [(get_script_workflow, script) for script in scripts]
+        + [(get_schedule_workflow, schedule) for schedule in schedules]
+    )
 
-    # process assest
-    for resource in resources:
-        # write workflow file
-        write_asset_workflow(resource)
+    workflows = [builder(path) for builder, path in builders]
 
-    # process assest
-    for asset in assets:
-        # write workflow file
-        write_asset_workflow(asset)
+    # then flush the (path, yaml) pairs in one parallel batch of small writes
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        list(executor.map(lambda workflow: write_workflow(*workflow), workflows))
 
-    # process scripts
-    for script in scripts:
-        # write workflow file
-        write_script_workflow(script)
 
-    # process schedules
-    for schedule in schedules:
-        # write workflow file
-        write_schedule_workflow(schedule)
+def get_paths():
+    # walks the working directory once, mapping each "/"-separated file path to its
+    # path on disk, skipping hidden entries like glob and pruning EXCLUDED_DIRECTORIES
+    paths = {}
+    directories = [""]
+    while directories:
+        directory = directories.pop()
+        try:
+            with os.scandir(directory or ".") as entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue
+                    path = directory + entry.name
+                    if entry.is_dir():
+                        if entry.name not in EXCLUDED_DIRECTORIES:
+                            directories.append(path + "/")
+                    else:
+                        paths[path] = path.replace("/", os.sep)
+        except OSError:
+            # skip directories that can't be read or were removed, like glob does
+            continue
+    return paths
+
+
+def find_paths(paths, pattern):
+    # matches paths against a glob pattern, where "**" spans any number of directories
+    regex = ""
+    parts = pattern.split("/")
+    for i, part in enumerate(parts):
+        if part == "**":
+            regex += "(?:[^/]+/)*"
+            continue
+        regex += "".join("[^/]*" if c == "*" else re.escape(c) for c in part)
+        if i < len(parts) - 1:
+            regex += "/"
+    regex = re.compile(regex)
+    return sorted(path for posix, path in paths.items() if regex.fullmatch(posix))
+
+
+def get_deployments(paths):
+    # indexes the deployment files found by the walk by their directory, so endpoints
+    # don't each glob their directory again
+    deployments = {}
+    for path in paths:
+        project_dir, _, name = path.rpartition("/")
+        if name.endswith(("deployment.yml", "deployment.yaml")):
+            deployments.setdefault(project_dir, []).append(path)
+    return deployments
 
 
 def check_readme(before, after):
@@ -397,166 +508,103 @@ def check_readme(before, after):
 
 
 def parse_path(path):
-    filename = None
-    project_dir = None
-    hyphenated = None
-    try:
-        filename = path.split(os.sep)[-1]
-    except:
-        pass
-    try:
-        project_dir = os.sep.join(path.split(os.sep)[:-1])
-    except:
-        pass
-    try:
-        hyphenated = path.replace(os.sep, "-").replace("/", "-")
-    except:
-        pass
+    # computes the forms of a path used by the readme and workflow writers once
+    posix = os.path.splitext(path)[0].replace(os.sep, "/")
+    project_dir, _, filename = posix.rpartition("/")
+    return PathInfo(path, posix, posix.replace("/", "-"), filename, project_dir)
 
-    return filename, project_dir, hyphenated
 
-
-def write_job_workflow(job):
-    filename, project_dir, hyphenated = parse_path(job)
-    posix_project_dir = project_dir.replace(os.sep, "/")
-    is_pipeline_sample = "jobs/pipelines" in job
-    is_spark_sample = "jobs/spark" in job
-    schedule_hour, schedule_minute = get_schedule_time(filename)
-    # Duplicate name in working directory during checkout
-    # https://github.com/actions/checkout/issues/739
-    workflow_yaml = f"""{READONLY_HEADER}
-name: cli-{hyphenated}
-on:
-  workflow_dispatch:
-  schedule:
-    - cron: "{schedule_minute} {schedule_hour}/{hours_between_runs} * * *"
-  pull_request:
-    branches:
-      - main
-    paths:
-      - cli/{posix_project_dir}/**
-      - infra/bootstrapping/**
-      - .github/workflows/cli-{hyphenated}.yml\n"""
+def get_job_workflow(job):
+    filename, posix_project_dir, hyphenated = (
+        job.filename,
+        job.project_dir,
+        job.hyphenated,
+    )
+    is_pipeline_sample = "jobs/pipelines" in job.posix
+    is_spark_sample = "jobs/spark" in job.posix
+    paths = [
+        f"cli/{posix_project_dir}/**",
+        "infra/bootstrapping/**",
+        f".github/workflows/cli-{hyphenated}.yml",
+    ]
     if is_pipeline_sample:
-        workflow_yaml += "      - cli/run-pipeline-jobs.sh\n" ""
+        paths.append("cli/run-pipeline-jobs.sh")
     if is_spark_sample:
-        workflow_yaml += "      - cli/jobs/spark/data/titanic.csv\n" ""
-    workflow_yaml += f"""      - cli/setup.sh
-permissions:
-  id-token: write
-concurrency:
-  group: {GITHUB_CONCURRENCY_GROUP}
-  cancel-in-progress: true
-jobs:
-  build:
-    runs-on: ubuntu-latest
-    steps:
-    - name: check out repo
-      uses: actions/checkout@v2
-    - name: azure login
-      uses: azure/login@v1
-      with:
-        client-id: ${{{{ secrets.OIDC_AZURE_CLIENT_ID }}}}
-        tenant-id: ${{{{ secrets.OIDC_AZURE_TENANT_ID }}}}
-        subscription-id: ${{{{ secrets.OIDC_AZURE_SUBSCRIPTION_ID }}}}
-    - name: bootstrap resources
-      run: |
-          echo '{GITHUB_CONCURRENCY_GROUP}';
-          bash bootstrap.sh
-      working-directory: infra/bootstrapping
-      continue-on-error: false
-    - name: setup-cli
-      run: |
-          source "{GITHUB_WORKSPACE}/infra/bootstrapping/sdk_helpers.sh";
-          source "{GITHUB_WORKSPACE}/infra/bootstrapping/init_environment.sh";
-          bash setup.sh
-      working-directory: cli
-      continue-on-error: true\n"""
+        paths.append("cli/jobs/spark/data/titanic.csv")
+    # Duplicate name in working directory during checkout
+    # https://github.com/actions/checkout/issues/739
+    workflow_yaml = [
+        get_workflow_prelude(
+            f"cli-{hyphenated}",
+            filename,
+            paths,
+            [f"echo '{GITHUB_CONCURRENCY_GROUP}';", "bash bootstrap.sh"],
+            "infra/bootstrapping",
+        )
+    ]
     if is_spark_sample:
-        workflow_yaml += get_spark_setup_workflow(job, posix_project_dir, filename)
-    workflow_yaml += f"""    - name: run job
+        workflow_yaml.append(
+            get_spark_setup_workflow(job.posix, posix_project_dir, filename)
+        )
+    workflow_yaml.append(
+        f"""    - name: run job
       run: |
           source "{GITHUB_WORKSPACE}/infra/bootstrapping/sdk_helpers.sh";
           source "{GITHUB_WORKSPACE}/infra/bootstrapping/init_environment.sh";\n"""
-    if "automl" in job and "image" in job:
-        workflow_yaml += f"""          bash \"{GITHUB_WORKSPACE}/infra/bootstrapping/sdk_helpers.sh\" replace_template_values \"prepare_data.py\";
+    )
+    if "automl" in job.posix and "image" in job.posix:
+        workflow_yaml.append(
+            f"""          bash \"{GITHUB_WORKSPACE}/infra/bootstrapping/sdk_helpers.sh\" replace_template_values \"prepare_data.py\";
           pip install azure-identity
           bash \"{GITHUB_WORKSPACE}/sdk/python/setup.sh\"  
           python prepare_data.py --subscription $SUBSCRIPTION_ID --group $RESOURCE_GROUP_NAME --workspace $WORKSPACE_NAME\n"""
-    elif "autotuning" in job:
-        workflow_yaml += f"""          bash -x generate-yml.sh\n"""
-        # workflow_yaml += f"""          bash -x {os.path.relpath(".", project_dir)}/run-job.sh generate-yml.yml\n"""
-    workflow_yaml += f"""          bash -x {os.path.relpath(".", project_dir).replace(os.sep, "/")}/run-job.sh {filename}.yml
+        )
+    elif "autotuning" in job.posix:
+        workflow_yaml.append(f"""          bash -x generate-yml.sh\n""")
+        # workflow_yaml.append(f"""          bash -x {os.path.relpath(".", project_dir)}/run-job.sh generate-yml.yml\n""")
+    workflow_yaml.append(
+        f"""          bash -x {get_relative_root(posix_project_dir)}/run-job.sh {filename}.yml
       working-directory: cli/{posix_project_dir}
     - name: validate readme
       run: |
           python check-readme.py "{GITHUB_WORKSPACE}/cli/{posix_project_dir}"
       working-directory: infra/bootstrapping
       continue-on-error: false\n"""
+    )
 
-    # write workflow
-    with open(
-        f"..{os.sep}.github{os.sep}workflows{os.sep}cli-{job.replace(os.sep, '-').replace('/', '-')}.yml",
-        "w",
-    ) as f:
-        f.write(workflow_yaml)
+    # return workflow path and content for write_workflows to flush
+    return (
+        os.path.join(WORKFLOW_DIR, f"cli-{hyphenated}.yml"),
+        "".join(workflow_yaml),
+    )
 
 
-def write_job_using_registry_components_workflow(job):
-    filename, project_dir, hyphenated = parse_path(job)
-    posix_project_dir = project_dir.replace(os.sep, "/")
-    folder_name = project_dir.split(os.sep)[-1]
-    is_pipeline_sample = "jobs/pipelines" in job
-    schedule_hour, schedule_minute = get_schedule_time(filename)
+def get_job_using_registry_components_workflow(job):
+    filename, posix_project_dir, hyphenated = (
+        job.filename,
+        job.project_dir,
+        job.hyphenated,
+    )
+    folder_name = posix_project_dir.split("/")[-1]
+    is_pipeline_sample = "jobs/pipelines" in job.posix
+    paths = [
+        f"cli/{posix_project_dir}/**",
+        "infra/bootstrapping/**",
+        f".github/workflows/cli-{hyphenated}-registry.yml",
+    ]
+    if is_pipeline_sample:
+        paths.append("cli/run-pipeline-jobs.sh")
     # Duplicate name in working directory during checkout
     # https://github.com/actions/checkout/issues/739
-    workflow_yaml = f"""{READONLY_HEADER}
-name: cli-{hyphenated}-registry
-on:
-  workflow_dispatch:
-  schedule:
-    - cron: "{schedule_minute} {schedule_hour}/{hours_between_runs} * * *"
-  pull_request:
-    branches:
-      - main
-    paths:
-      - cli/{posix_project_dir}/**
-      - infra/bootstrapping/**
-      - .github/workflows/cli-{hyphenated}-registry.yml\n"""
-    if is_pipeline_sample:
-        workflow_yaml += "      - cli/run-pipeline-jobs.sh\n" ""
-    workflow_yaml += f"""      - cli/setup.sh
-permissions:
-  id-token: write
-concurrency:
-  group: {GITHUB_CONCURRENCY_GROUP}
-  cancel-in-progress: true
-jobs:
-  build:
-    runs-on: ubuntu-latest
-    steps:
-    - name: check out repo
-      uses: actions/checkout@v2
-    - name: azure login
-      uses: azure/login@v1
-      with:
-        client-id: ${{{{ secrets.OIDC_AZURE_CLIENT_ID }}}}
-        tenant-id: ${{{{ secrets.OIDC_AZURE_TENANT_ID }}}}
-        subscription-id: ${{{{ secrets.OIDC_AZURE_SUBSCRIPTION_ID }}}}
-    - name: bootstrap resources
-      run: |
-          echo '{GITHUB_CONCURRENCY_GROUP}';
-          bash bootstrap.sh
-      working-directory: infra
-      continue-on-error: false
-    - name: setup-cli
-      run: |
-          source "{GITHUB_WORKSPACE}/infra/bootstrapping/sdk_helpers.sh";
-          source "{GITHUB_WORKSPACE}/infra/bootstrapping/init_environment.sh";
-          bash setup.sh
-      working-directory: cli
-      continue-on-error: true
-    - name: validate readme
+    workflow_yaml = [
+        get_workflow_prelude(
+            f"cli-{hyphenated}-registry",
+            filename,
+            paths,
+            [f"echo '{GITHUB_CONCURRENCY_GROUP}';", "bash bootstrap.sh"],
+            "infra",
+        ),
+        f"""    - name: validate readme
       run: |
           python check-readme.py "{GITHUB_WORKSPACE}/cli/{posix_project_dir}"
       working-directory: infra/bootstrapping
@@ -564,92 +612,63 @@ jobs:
     - name: run job
       run: |
           source "{GITHUB_WORKSPACE}/infra/bootstrapping/sdk_helpers.sh";
-          source "{GITHUB_WORKSPACE}/infra/bootstrapping/init_environment.sh";\n"""
-    if "automl" in job and "image" in job:
-        workflow_yaml += f"""          bash \"{GITHUB_WORKSPACE}/infra/bootstrapping/sdk_helpers.sh\" replace_template_values \"prepare_data.py\";
+          source "{GITHUB_WORKSPACE}/infra/bootstrapping/init_environment.sh";\n""",
+    ]
+    if "automl" in job.posix and "image" in job.posix:
+        workflow_yaml.append(
+            f"""          bash \"{GITHUB_WORKSPACE}/infra/bootstrapping/sdk_helpers.sh\" replace_template_values \"prepare_data.py\";
           pip install azure-identity
           bash \"{GITHUB_WORKSPACE}/sdk/python/setup.sh\"  
           python prepare_data.py --subscription $SUBSCRIPTION_ID --group $RESOURCE_GROUP_NAME --workspace $WORKSPACE_NAME\n"""
-    workflow_yaml += f"""          bash -x {os.path.relpath(".", project_dir).replace(os.sep, "/")}/run-pipeline-job-with-registry-components.sh {filename} {folder_name}
+        )
+    workflow_yaml.append(
+        f"""          bash -x {get_relative_root(posix_project_dir)}/run-pipeline-job-with-registry-components.sh {filename} {folder_name}
       working-directory: cli/{posix_project_dir}\n"""
+    )
 
-    # write workflow
-    with open(
-        f"..{os.sep}.github{os.sep}workflows{os.sep}cli-{job.replace(os.sep, '-').replace('/', '-')}-registry.yml",
-        "w",
-    ) as f:
-        f.write(workflow_yaml)
+    # return workflow path and content for write_workflows to flush
+    return (
+        os.path.join(WORKFLOW_DIR, f"cli-{hyphenated}-registry.yml"),
+        "".join(workflow_yaml),
+    )
 
 
-def write_endpoint_workflow(endpoint):
-    filename, project_dir, hyphenated = parse_path(endpoint)
-    project_dir = project_dir.replace(os.sep, "/")
-    deployments = sorted(
-        glob.glob(project_dir + "/*deployment.yml", recursive=True)
-        + glob.glob(project_dir + "/*deployment.yaml", recursive=True)
+def get_endpoint_workflow(endpoint, deployments):
+    filename, project_dir, hyphenated = (
+        endpoint.filename,
+        endpoint.project_dir,
+        endpoint.hyphenated,
     )
     deployments = [
         deployment
-        for deployment in deployments
-        if not any(excluded in deployment for excluded in EXCLUDED_DEPLOYMENTS)
+        for deployment in sorted(deployments.get(project_dir, []))
+        if not EXCLUDED_DEPLOYMENTS_PATTERN.search(deployment)
     ]
-    schedule_hour, schedule_minute = get_schedule_time(filename)
     endpoint_type = (
         "online"
-        if "endpoints/online/" in endpoint
+        if "endpoints/online/" in endpoint.posix
         else "batch"
-        if "endpoints/batch/" in endpoint
+        if "endpoints/batch/" in endpoint.posix
         else "unknown"
     )
     endpoint_name = hyphenated[-28:].replace("-", "") + str(
         random.randrange(1000, 9999)
     )
 
-    create_endpoint_yaml = f"""{READONLY_HEADER}
-name: cli-{hyphenated}
-on:
-  workflow_dispatch:
-  schedule:
-    - cron: "{schedule_minute} {schedule_hour}/{hours_between_runs} * * *"
-  pull_request:
-    branches:
-      - main
-    paths:
-      - cli/{project_dir}/**
-      - cli/endpoints/{endpoint_type}/**
-      - infra/bootstrapping/**
-      - .github/workflows/cli-{hyphenated}.yml
-      - cli/setup.sh
-permissions:
-  id-token: write
-concurrency:
-  group: {GITHUB_CONCURRENCY_GROUP}
-  cancel-in-progress: true
-jobs:
-  build:
-    runs-on: ubuntu-latest
-    steps:
-    - name: check out repo
-      uses: actions/checkout@v2
-    - name: azure login
-      uses: azure/login@v1
-      with:
-        client-id: ${{{{ secrets.OIDC_AZURE_CLIENT_ID }}}}
-        tenant-id: ${{{{ secrets.OIDC_AZURE_TENANT_ID }}}}
-        subscription-id: ${{{{ secrets.OIDC_AZURE_SUBSCRIPTION_ID }}}}
-    - name: bootstrap resources
-      run: |
-          bash bootstrap.sh
-      working-directory: infra/bootstrapping
-      continue-on-error: false
-    - name: setup-cli
-      run: |
-          source "{GITHUB_WORKSPACE}/infra/bootstrapping/sdk_helpers.sh";
-          source "{GITHUB_WORKSPACE}/infra/bootstrapping/init_environment.sh";
-          bash setup.sh
-      working-directory: cli
-      continue-on-error: true
-    - name: validate readme
+    workflow_yaml = [
+        get_workflow_prelude(
+            f"cli-{hyphenated}",
+            filename,
+            [
+                f"cli/{project_dir}/**",
+                f"cli/endpoints/{endpoint_type}/**",
+                "infra/bootstrapping/**",
+                f".github/workflows/cli-{hyphenated}.yml",
+            ],
+            ["bash bootstrap.sh"],
+            "infra/bootstrapping",
+        ),
+        f"""    - name: validate readme
       run: |
           python check-readme.py "{GITHUB_WORKSPACE}/cli/{project_dir}"
       working-directory: infra/bootstrapping
@@ -665,88 +684,59 @@ jobs:
       run: |
           source "{GITHUB_WORKSPACE}/infra/bootstrapping/sdk_helpers.sh";
           source "{GITHUB_WORKSPACE}/infra/bootstrapping/init_environment.sh";
-          cat {endpoint}.yml
-          az ml {endpoint_type}-endpoint create -n {endpoint_name} -f {endpoint}.yml
-      working-directory: cli\n"""
+          cat {endpoint.raw}
+          az ml {endpoint_type}-endpoint create -n {endpoint_name} -f {endpoint.raw}
+      working-directory: cli\n""",
+    ]
 
-    cleanup_yaml = f"""    - name: cleanup endpoint
+    for deployment in deployments:
+        deployment = deployment.replace(".yml", "").replace(".yaml", "")
+        workflow_yaml.append(
+            f"""    - name: create deployment
       run: |
           source "{GITHUB_WORKSPACE}/infra/bootstrapping/sdk_helpers.sh";
           source "{GITHUB_WORKSPACE}/infra/bootstrapping/init_environment.sh";
-          az ml {endpoint_type}-endpoint delete -n {endpoint_name} -y
+          cat {deployment}.yml
+          az ml {endpoint_type}-deployment create -e {endpoint_name} -f {deployment}.yml
       working-directory: cli\n"""
+        )
 
-    workflow_yaml = create_endpoint_yaml
-
-    if (deployments is not None) and (len(deployments) > 0):
-        for deployment in deployments:
-            deployment = deployment.replace(".yml", "").replace(".yaml", "")
-            deployment_yaml = f"""    - name: create deployment
+    workflow_yaml.append(
+        f"""    - name: cleanup endpoint
       run: |
           source "{GITHUB_WORKSPACE}/infra/bootstrapping/sdk_helpers.sh";
           source "{GITHUB_WORKSPACE}/infra/bootstrapping/init_environment.sh";
-          cat {deployment}.yml
-          az ml {endpoint_type}-deployment create -e {endpoint_name} -f {deployment}.yml
+          az ml {endpoint_type}-endpoint delete -n {endpoint_name} -y
       working-directory: cli\n"""
+    )
 
-            workflow_yaml += deployment_yaml
-
-    workflow_yaml += cleanup_yaml
-
-    # write workflow
-    with open(f"../.github/workflows/cli-{hyphenated}.yml", "w") as f:
-        f.write(workflow_yaml)
+    # return workflow path and content for write_workflows to flush
+    return (
+        os.path.join(WORKFLOW_DIR, f"cli-{hyphenated}.yml"),
+        "".join(workflow_yaml),
+    )
 
 
-def write_asset_workflow(asset):
-    filename, project_dir, hyphenated = parse_path(asset)
-    project_dir = project_dir.replace(os.sep, "/")
-    posix_asset = asset.replace(os.sep, "/")
-    schedule_hour, schedule_minute = get_schedule_time(filename)
-    workflow_yaml = f"""{READONLY_HEADER}
-name: cli-{hyphenated}
-on:
-  workflow_dispatch:
-  schedule:
-    - cron: "{schedule_minute} {schedule_hour}/{hours_between_runs} * * *"
-  pull_request:
-    branches:
-      - main
-    paths:
-      - cli/{posix_asset}.yml
-      - infra/bootstrapping/**
-      - .github/workflows/cli-{hyphenated}.yml
-      - cli/setup.sh
-permissions:
-  id-token: write
-concurrency:
-  group: {GITHUB_CONCURRENCY_GROUP}
-  cancel-in-progress: true
-jobs:
-  build:
-    runs-on: ubuntu-latest
-    steps:
-    - name: check out repo
-      uses: actions/checkout@v2
-    - name: azure login
-      uses: azure/login@v1
-      with:
-        client-id: ${{{{ secrets.OIDC_AZURE_CLIENT_ID }}}}
-        tenant-id: ${{{{ secrets.OIDC_AZURE_TENANT_ID }}}}
-        subscription-id: ${{{{ secrets.OIDC_AZURE_SUBSCRIPTION_ID }}}}
-    - name: bootstrap resources
-      run: |
-          bash bootstrapping/bootstrap.sh
-      working-directory: infra
-      continue-on-error: false
-    - name: setup-cli
-      run: |
-          source "{GITHUB_WORKSPACE}/infra/bootstrapping/sdk_helpers.sh";
-          source "{GITHUB_WORKSPACE}/infra/bootstrapping/init_environment.sh";
-          bash setup.sh
-      working-directory: cli
-      continue-on-error: true
-    - name: validate readme
+def get_asset_workflow(asset):
+    filename, project_dir, hyphenated = (
+        asset.filename,
+        asset.project_dir,
+        asset.hyphenated,
+    )
+    posix_asset = asset.posix
+    workflow_yaml = [
+        get_workflow_prelude(
+            f"cli-{hyphenated}",
+            filename,
+            [
+                f"cli/{posix_asset}.yml",
+                "infra/bootstrapping/**",
+                f".github/workflows/cli-{hyphenated}.yml",
+            ],
+            ["bash bootstrapping/bootstrap.sh"],
+            "infra",
+        ),
+        f"""    - name: validate readme
       run: |
           python check-readme.py "{GITHUB_WORKSPACE}/cli/{project_dir}"
       working-directory: infra/bootstrapping
@@ -755,64 +745,36 @@ jobs:
       run: |
           source "{GITHUB_WORKSPACE}/infra/bootstrapping/sdk_helpers.sh";
           source "{GITHUB_WORKSPACE}/infra/bootstrapping/init_environment.sh";
-          az ml {asset.split(os.sep)[1]} create -f {posix_asset}.yml
-      working-directory: cli\n"""
+          az ml {posix_asset.split("/")[1]} create -f {posix_asset}.yml
+      working-directory: cli\n""",
+    ]
 
-    # write workflow
-    with open(
-        f"..{os.sep}.github{os.sep}workflows{os.sep}cli-{hyphenated}.yml", "w"
-    ) as f:
-        f.write(workflow_yaml)
+    # return workflow path and content for write_workflows to flush
+    return (
+        os.path.join(WORKFLOW_DIR, f"cli-{hyphenated}.yml"),
+        "".join(workflow_yaml),
+    )
 
 
-def write_script_workflow(script):
-    filename, project_dir, hyphenated = parse_path(script)
-    project_dir = project_dir.replace(os.sep, "/")
-    schedule_hour, schedule_minute = get_schedule_time(filename)
-    workflow_yaml = f"""{READONLY_HEADER}
-name: cli-scripts-{hyphenated}
-on:
-  workflow_dispatch:
-  schedule:
-    - cron: "{schedule_minute} {schedule_hour}/{hours_between_runs} * * *"
-  pull_request:
-    branches:
-      - main
-    paths:
-      - cli/{script}.sh
-      - infra/bootstrapping/**
-      - .github/workflows/cli-scripts-{hyphenated}.yml
-      - cli/setup.sh
-permissions:
-  id-token: write
-concurrency:
-  group: {GITHUB_CONCURRENCY_GROUP}
-  cancel-in-progress: true
-jobs:
-  build:
-    runs-on: ubuntu-latest
-    steps:
-    - name: check out repo
-      uses: actions/checkout@v2
-    - name: azure login
-      uses: azure/login@v1
-      with:
-        client-id: ${{{{ secrets.OIDC_AZURE_CLIENT_ID }}}}
-        tenant-id: ${{{{ secrets.OIDC_AZURE_TENANT_ID }}}}
-        subscription-id: ${{{{ secrets.OIDC_AZURE_SUBSCRIPTION_ID }}}}
-    - name: bootstrap resources
-      run: |
-          bash bootstrap.sh
-      working-directory: infra
-      continue-on-error: false
-    - name: setup-cli
-      run: |
-          source "{GITHUB_WORKSPACE}/infra/bootstrapping/sdk_helpers.sh";
-          source "{GITHUB_WORKSPACE}/infra/bootstrapping/init_environment.sh";
-          bash setup.sh
-      working-directory: cli
-      continue-on-error: true
-    - name: validate readme
+def get_script_workflow(script):
+    filename, project_dir, hyphenated = (
+        script.filename,
+        script.project_dir,
+        script.hyphenated,
+    )
+    workflow_yaml = [
+        get_workflow_prelude(
+            f"cli-scripts-{hyphenated}",
+            filename,
+            [
+                f"cli/{script.posix}.sh",
+                "infra/bootstrapping/**",
+                f".github/workflows/cli-scripts-{hyphenated}.yml",
+            ],
+            ["bash bootstrap.sh"],
+            "infra",
+        ),
+        f"""    - name: validate readme
       run: |
           python check-readme.py "{GITHUB_WORKSPACE}/cli/{project_dir}"
       working-directory: infra/bootstrapping
@@ -821,63 +783,37 @@ jobs:
       run: |
           source "{GITHUB_WORKSPACE}/infra/bootstrapping/sdk_helpers.sh";
           source "{GITHUB_WORKSPACE}/infra/bootstrapping/init_environment.sh";
-          set -e; bash -x {script}.sh
-      working-directory: cli\n"""
+          set -e; bash -x {script.posix}.sh
+      working-directory: cli\n""",
+    ]
 
-    # write workflow
-    with open(f"../.github/workflows/cli-scripts-{hyphenated}.yml", "w") as f:
-        f.write(workflow_yaml)
+    # return workflow path and content for write_workflows to flush
+    return (
+        os.path.join(WORKFLOW_DIR, f"cli-scripts-{hyphenated}.yml"),
+        "".join(workflow_yaml),
+    )
 
 
-def write_schedule_workflow(schedule):
-    filename, project_dir, hyphenated = parse_path(schedule)
-    project_dir = project_dir.replace(os.sep, "/")
-    posix_schedule = schedule.replace(os.sep, "/")
-    schedule_hour, schedule_minute = get_schedule_time(filename)
-    workflow_yaml = f"""{READONLY_HEADER}
-name: cli-schedules-{hyphenated}
-on:
-  workflow_dispatch:
-  schedule:
-    - cron: "{schedule_minute} {schedule_hour}/{hours_between_runs} * * *"
-  pull_request:
-    branches:
-      - main
-    paths:
-      - cli/{posix_schedule}.yml
-      - infra/bootstrapping/**
-      - .github/workflows/cli-schedules-{hyphenated}.yml
-      - cli/setup.sh
-permissions:
-  id-token: write
-concurrency:
-  group: {GITHUB_CONCURRENCY_GROUP}
-  cancel-in-progress: true
-jobs:
-  build:
-    runs-on: ubuntu-latest
-    steps:
-    - name: check out repo
-      uses: actions/checkout@v2
-    - name: azure login
-      uses: azure/login@v1
-      with:
-        client-id: ${{{{ secrets.OIDC_AZURE_CLIENT_ID }}}}
-        tenant-id: ${{{{ secrets.OIDC_AZURE_TENANT_ID }}}}
-        subscription-id: ${{{{ secrets.OIDC_AZURE_SUBSCRIPTION_ID }}}}
-    - name: bootstrap resources
-      run: |
-          bash bootstrap.sh
-      working-directory: infra
-      continue-on-error: false
-    - name: setup-cli
-      run: |
-          source "{GITHUB_WORKSPACE}/infra/bootstrapping/sdk_helpers.sh";
-          source "{GITHUB_WORKSPACE}/infra/bootstrapping/init_environment.sh";
-          bash setup.sh
-      working-directory: cli
-      continue-on-error: true
-    - name: validate readme
+def get_schedule_workflow(schedule):
+    filename, project_dir, hyphenated = (
+        schedule.filename,
+        schedule.project_dir,
+        schedule.hyphenated,
+    )
+    posix_schedule = schedule.posix
+    workflow_yaml = [
+        get_workflow_prelude(
+            f"cli-schedules-{hyphenated}",
+            filename,
+            [
+                f"cli/{posix_schedule}.yml",
+                "infra/bootstrapping/**",
+                f".github/workflows/cli-schedules-{hyphenated}.yml",
+            ],
+            ["bash bootstrap.sh"],
+            "infra",
+        ),
+        f"""    - name: validate readme
       run: |
           python check-readme.py "{GITHUB_WORKSPACE}/cli/{project_dir}"
       working-directory: infra/bootstrapping
@@ -893,20 +829,96 @@ jobs:
           source "{GITHUB_WORKSPACE}/infra/bootstrapping/sdk_helpers.sh";
           source "{GITHUB_WORKSPACE}/infra/bootstrapping/init_environment.sh";
           az ml schedule disable --name ci_test_{filename}
-      working-directory: cli\n"""
+      working-directory: cli\n""",
+    ]
+
+    # return workflow path and content for write_workflows to flush
+    return (
+        os.path.join(WORKFLOW_DIR, f"cli-schedules-{hyphenated}.yml"),
+        "".join(workflow_yaml),
+    )
+
+
+def get_workflow_prelude(name, filename, paths, bootstrap, bootstrap_dir):
+    # renders the part of the workflow shared by every writer
+    schedule_hour, schedule_minute = get_schedule_time(filename)
+    values = {
+        "name": name,
+        "schedule_minute": str(schedule_minute),
+        "schedule_hour": str(schedule_hour),
+        "hours_between_runs": str(hours_between_runs),
+        "paths": "".join(f"      - {path}\n" for path in paths),
+        "concurrency_group": GITHUB_CONCURRENCY_GROUP,
+        "bootstrap": "".join(f"          {command}\n" for command in bootstrap),
+        "bootstrap_dir": bootstrap_dir,
+        "workspace": GITHUB_WORKSPACE,
+    }
+    prelude = [WORKFLOW_PRELUDE_STATICS[0]]
+    for key, static in zip(WORKFLOW_PRELUDE_KEYS, WORKFLOW_PRELUDE_STATICS[1:]):
+        prelude += (values[key], static)
+    return "".join(prelude)
 
-    # write workflow
-    with open(f"../.github/workflows/cli-schedules-{hyphenated}.yml", "w") as f:
-        f.write(workflow_yaml)
 
+def write_workflow(path, workflow_yaml):
+    # skip the write if the workflow file already has this content
+    data = workflow_yaml.encode()
+    try:
+        if os.path.getsize(path) == len(data) and Path(path).read_bytes() == data:
+            return
+    except OSError:
+        pass
+
+    write_file(path, data)
+
+
+def write_file(path, data):
+    # writes bytes straight to the file descriptor, as the generated files are small
+    fd = os.open(
+        path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644
+    )
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view) :]
+    finally:
+        os.close(fd)
 
+
+@lru_cache(maxsize=None)
+def get_relative_root(project_dir):
+    # gets the "/"-separated path from a project directory back to cli, which every
+    # job in the same directory shares
+    return os.path.relpath(".", project_dir).replace(os.sep, "/")
+
+
+@lru_cache(maxsize=None)
 def get_schedule_time(filename):
-    name_hash = int(hashlib.sha512(filename.encode()).hexdigest(), 16)
-    schedule_minute = name_hash % 60
-    schedule_hour = (name_hash // 60) % hours_between_runs
+    # a short non-cryptographic digest is enough to spread the runs out
+    name_hash = int.from_bytes(
+        hashlib.blake2b(filename.encode(), digest_size=8).digest(), "big"
+    )
+    name_hash, schedule_minute = divmod(name_hash, 60)
+    schedule_hour = name_hash % hours_between_runs
     return schedule_hour, schedule_minute
 
 
+def get_descriptions(paths):
+    # maps each .yml file to the description found in it
+    descriptions = {}
+    for path in paths:
+        if path in descriptions:
+            continue
+        description = "*no description*"
+        try:
+            match = DESCRIPTION_PATTERN.search(Path(path).read_bytes())
+            if match:
+                description = match.group(1).decode().strip()
+        except:
+            pass
+        descriptions[path] = description
+    return descriptions
+
+
 def get_endpoint_name(filename, hyphenated):
     # gets the endpoint name from the .yml file
     with open(filename, "r") as f:
@@ -915,39 +927,26 @@ def get_endpoint_name(filename, hyphenated):
 
 
 def get_spark_setup_workflow(job, posix_project_dir, filename):
-    is_attached = "attached-spark" in job
-    is_user_identity = "user-identity" in job
-    is_managed_identity = "managed-identity" in job
-    is_default_identity = "default-identity" in job
-    workflow = f"""    - name: upload data
-      run: |
-          bash -x upload-data-to-blob.sh jobs/spark/
-      working-directory: cli
-      continue-on-error: true\n"""
-    if is_managed_identity:
-        workflow += f"""    - name: setup identities
+    workflow = [SPARK_UPLOAD_DATA_STEP]
+    if "managed-identity" in job:
+        workflow.append(
+            f"""    - name: setup identities
       run: |
           bash -x setup-identities.sh
       working-directory: cli/{posix_project_dir}
       continue-on-error: true\n"""
-    if is_attached:
-        workflow += f"""    - name: setup attached spark
-      working-directory: cli
-      continue-on-error: true"""
-    if is_attached and is_user_identity:
-        workflow += f"""
-      run: |
-          bash -x {posix_project_dir}/setup-attached-resources.sh resources/compute/attached-spark-user-identity.yml {posix_project_dir}/{filename}.yml\n"""
-    if is_attached and is_managed_identity:
-        workflow += f"""
-      run: |
-          bash -x {posix_project_dir}/setup-attached-resources.sh resources/compute/attached-spark-system-identity.yml {posix_project_dir}/{filename}.yml\n"""
-    if is_attached and is_default_identity:
-        workflow += f"""
+        )
+    if "attached-spark" in job:
+        workflow.append(SPARK_SETUP_ATTACHED_STEP)
+        for identity, compute in SPARK_ATTACHED_COMPUTES:
+            if identity in job:
+                workflow.append(
+                    f"""
       run: |
-          bash -x {posix_project_dir}/setup-attached-resources.sh resources/compute/attached-spark.yml {posix_project_dir}/{filename}.yml\n"""
+          bash -x {posix_project_dir}/setup-attached-resources.sh resources/compute/{compute} {posix_project_dir}/{filename}.yml\n"""
+                )
 
-    return workflow
+    return "".join(workflow)
 
 
 # run functions